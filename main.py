@@ -1,24 +1,210 @@
+import asyncio
+import contextlib
 import csv
+import functools
+import io
 import requests
-from bs4 import BeautifulSoup
-from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup, SoupStrainer
+from datetime import date
 import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
 import sys
+import tempfile
 from urllib.parse import urlparse, unquote
 import re
+import shutil
 import json
+import logging
 import random
 import os
 import ollama
 
+# aiohttp lets recipe pages be prefetched concurrently; without it each page is
+# fetched on demand through the requests session
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# orjson decodes JSON-LD blocks and model replies several times faster than the stdlib
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# Prefer the C-based lxml parser; fall back to the stdlib parser if it isn't installed
+try:
+    import lxml  # noqa: F401
+    _HTML_PARSER = 'lxml'
+except ImportError:
+    _HTML_PARSER = 'html.parser'
+
+log = logging.getLogger(__name__)
+
+# Only the tags extract_title consults; everything else is skipped while parsing
+_TITLE_STRAINER = SoupStrainer(['meta', 'script', 'h1', 'title'])
+
+# Trailing site boilerplate such as " - Recipe" or " | Food Kitchen"
+_TITLE_TAIL_RE = re.compile(r'\s*[-|]\s*(?:Recipe|Recipes|Cooking|Kitchen|Food).*$', re.IGNORECASE)
+
+# Ingredient class names, ids, list items and section headings
+_INGREDIENT_RE = re.compile(r'ingredient', re.IGNORECASE)
+_INGREDIENT_ITEM_RE = re.compile(r'ingredient|item', re.IGNORECASE)
+_INGREDIENTS_HEADING_RE = re.compile(r'ingredients?', re.IGNORECASE)
+_HEADING_TAGS = frozenset(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
+_INGREDIENT_SELECTOR = 'h1, h2, h3, h4, h5, h6, [class*="ingredient" i], [id*="ingredient" i]'
+
+# Turning a URL filename into words
+_URL_WORD_SEP_RE = re.compile(r'[-_]')
+_HTML_EXT_RE = re.compile(r'\.html?$', re.IGNORECASE)
+
+# Recipe pages fetched at once during the prefetch, to stay polite to recipe sites
+_FETCH_CONCURRENCY = 8
+
+# Longest recipe text sent to the model for one recipe
+_RECIPE_CONTENT_LIMIT = 4000
+
+# A small 4-bit model is plenty for spotting allergens in a short ingredient list.
+# One recipe (capped at 4000 characters) plus the prompt fits in a 2048-token context.
+_ALLERGY_MODEL = 'llama3.2:3b-instruct-q4_K_M'
+_ALLERGY_NUM_CTX = 2048
+_ALLERGY_KEEP_ALIVE = '30m'
+
+# Recipes per batched allergy request, and a context window large enough to hold
+# that many recipes (each trimmed to 4000 characters) plus the model's reply
+_ALLERGY_BATCH_SIZE = 4
+_ALLERGY_BATCH_NUM_CTX = 8192
+
+# Batched allergy requests in flight at once; the server queues any beyond its parallel slots
+_ALLERGY_WORKERS = 4
+
+# Random draws to try before falling back to scanning for an allowed recipe
+_SAMPLE_ATTEMPTS = 8
+
+# Google Calendar CSV import columns
+_FIELDS = ('Subject', 'Start Date', 'Start Time', 'End Date', 'End Time',
+           'All Day Event', 'Description', 'Location', 'Private')
+
+# Characters that force a CSV field to be quoted (the csv module's default excel dialect)
+_CSV_SPECIAL = (',', '"', '\r', '\n')
+
+# Fixed column values: every event is an all-day, non-private entry, so the time
+# columns stay empty, and prep reminders are placed in the kitchen
+_ALL_DAY = 'True'
+_PRIVATE = 'False'
+_PREP_LOCATION = 'Kitchen'
+
+# Check mark for the summary, spelled as an escape so the source stays ASCII-safe
+_CHECK = "\u2713"
+
+# Days of events formatted and written per chunk (at most four rows a day)
+_WRITE_CHUNK_DAYS = 256
+
+# Output buffer for the calendar CSV, so long horizons flush in a few large writes
+_WRITE_BUFFER_SIZE = 1 << 20
+
+# Input file formats shown at the end of --help
+_EPILOG = """
+CSV format (when using --file):
+url,days
+https://example.com/chicken-salad,3
+https://example.com/beef-stew,2
+
+Allergies file format (when using --allergies):
+nuts
+dairy
+gluten
+shellfish
+        """
+
+_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36'
+}
+
+
+def _add_days(d, n):
+    """Return the date n days after d, without building a timedelta"""
+    return date.fromordinal(d.toordinal() + n)
+
+def _escape(field):
+    """Quote a CSV field only when it holds a comma, quote or line break"""
+    if any(c in field for c in _CSV_SPECIAL):
+        return '"' + field.replace('"', '""') + '"'
+    return field
+
+def _format_rows(rows):
+    """Render rows as CSV text, byte-for-byte what csv.writer would produce"""
+    return ''.join(','.join(map(_escape, row)) + '\r\n' for row in rows)
+
+@functools.lru_cache(maxsize=8)
+def _parse_recipes_cached(filename, mtime_ns, size):
+    """Parse a url,days CSV into (url, days) pairs; mtime and size key the cache so edits re-read it"""
+    with open(filename, newline='', encoding='utf-8') as csvfile:
+        text = csvfile.read()
+
+    # Plain url,days files need no quote handling, so split lines directly;
+    # anything else (quotes, bare \r, other columns) goes through the csv module
+    text = text.replace('\r\n', '\n')
+    lines = text.split('\n')
+    if '"' in text or '\r' in text or lines[0] != 'url,days':
+        rows = ((row['url'], row.get('days')) for row in csv.DictReader(io.StringIO(text, newline='')))
+    else:
+        rows = []
+        for line in lines[1:]:
+            if line:
+                url, _, days = line.partition(',')
+                # Columns past days are ignored, as DictReader does
+                rows.append((url, days.partition(',')[0]))
+
+    recipes = []
+    for url, days in rows:
+        url = url.strip()
+        try:
+            days = int(days)
+        except (TypeError, ValueError):
+            # Missing or non-numeric days (an empty field included)
+            days = 5
+        recipes.append((url, days))
+    return tuple(recipes)
+
+@functools.lru_cache(maxsize=256)
+def _title_from_url(url):
+    """Derive a readable title from the last path segment of a URL"""
+    filename = urlparse(url).path.rpartition('/')[2]
+    filename = unquote(filename)
+    filename = _URL_WORD_SEP_RE.sub(' ', filename)
+    filename = _HTML_EXT_RE.sub('', filename)
+    return filename.strip() or "Recipe"
+
 class MealPrepCalendarGenerator:
     def __init__(self, seed=None, allergies_file=None):
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36'
-        }
-        if seed is not None:
-            random.seed(seed)
+        self.headers = _HEADERS
+        # Reuse connections across recipe fetches on the synchronous path, retrying
+        # transient server errors and rate limits with a short backoff
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        retries = Retry(total=2, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=retries)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # A private generator, so the seed isn't disturbed by other users of the random module
+        self._rng = random.Random(seed)
         
+        # Titles already resolved this run, keyed by URL
+        self._title_cache = {}
+        # Prefetched page bodies (or the fetch error), keyed by URL
+        self._page_cache = {}
+        # Formatted recipe content and (allergens, substitutes) results, keyed by URL
+        self._content_cache = {}
+        self._allergy_cache = {}
+        # Decoded JSON-LD Recipe node per URL, shared by title and content extraction
+        self._jsonld_cache = {}
+
         # Load allergies from file
         self.allergies = []
         if allergies_file and os.path.exists(allergies_file):
@@ -27,31 +213,22 @@ class MealPrepCalendarGenerator:
 
     def extract_recipe_content(self, url):
         """Extract recipe content from URL, focusing on ingredients section"""
+        if url not in self._content_cache:
+            self._content_cache[url] = self._extract_recipe_content(url)
+        return self._content_cache[url]
+
+    def _extract_recipe_content(self, url):
         try:
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
+            soup, recipe_data = self._load_page(url)
             
             recipe_content = {}
             
             # Try to extract structured recipe data first (most reliable)
-            scripts = soup.find_all('script', type='application/ld+json')
-            for script in scripts:
+            if recipe_data:
                 try:
-                    data = json.loads(script.string)
-                    if isinstance(data, list):
-                        for entry in data:
-                            if isinstance(entry, dict) and ('Recipe' in str(entry.get('@type', ''))):
-                                recipe_content = self._extract_structured_recipe_data(entry)
-                                break
-                    elif isinstance(data, dict) and ('Recipe' in str(data.get('@type', ''))):
-                        recipe_content = self._extract_structured_recipe_data(data)
-                        break
-                        
-                    if recipe_content:
-                        break
+                    recipe_content = self._extract_structured_recipe_data(recipe_data)
                 except Exception:
-                    continue
+                    recipe_content = {}
             
             # If no structured data, look for ingredients section specifically
             if not recipe_content.get('ingredients'):
@@ -64,13 +241,45 @@ class MealPrepCalendarGenerator:
                 recipe_content['name'] = self._extract_recipe_name(soup)
             
             # Format for AI analysis
-            formatted_content = self._format_recipe_for_analysis(recipe_content)
-            return formatted_content[:4000]  # Limit length
+            return self._format_recipe_for_analysis(recipe_content)
             
         except Exception as e:
-            print(f"Warning: Could not extract recipe content from {url}: {e}")
+            log.warning("Warning: Could not extract recipe content from %s: %s", url, e)
             return ""
 
+    def _load_page(self, url):
+        """Fetch and parse a recipe page, returning the soup and its JSON-LD Recipe node"""
+        soup = BeautifulSoup(self._fetch_page(url), _HTML_PARSER)
+        return soup, self._recipe_jsonld(url, soup)
+
+    def _recipe_jsonld(self, url, soup):
+        """Return the page's JSON-LD Recipe node (or None), decoding each page only once"""
+        if url not in self._jsonld_cache:
+            self._jsonld_cache[url] = self._find_recipe_jsonld(soup)
+        return self._jsonld_cache[url]
+
+    def _find_recipe_jsonld(self, soup):
+        """Find the first Recipe node among the page's JSON-LD scripts"""
+        for script in soup.find_all('script', type='application/ld+json'):
+            try:
+                # orjson only accepts exact str/bytes, not bs4's NavigableString
+                data = _json_loads(script.string.encode())
+            except Exception:
+                continue
+            entries = data if isinstance(data, list) else [data]
+            for entry in entries:
+                if self._is_recipe(entry):
+                    return entry
+        return None
+
+    def _is_recipe(self, data):
+        """Check whether a JSON-LD node is typed as a Recipe"""
+        if not isinstance(data, dict):
+            return False
+        # @type is either a single string or a list of types
+        recipe_type = data.get('@type')
+        return recipe_type == 'Recipe' or (isinstance(recipe_type, list) and 'Recipe' in recipe_type)
+
     def _extract_structured_recipe_data(self, recipe_data):
         """Extract data from JSON-LD structured recipe data"""
         content = {}
@@ -94,54 +303,35 @@ class MealPrepCalendarGenerator:
 
     def _extract_ingredients_from_html(self, soup):
         """Extract ingredients from HTML by looking for ingredients sections"""
-        ingredients = []
+        class_matches = []
+        id_matches = []
         
-        # Common patterns for ingredients sections
-        ingredient_patterns = [
-            # Look for headings that say "ingredients"
-            {'tag': ['h1', 'h2', 'h3', 'h4', 'h5', 'h6'], 
-             'text_pattern': r'ingredients?', 'flags': re.IGNORECASE},
-            # Look for elements with ingredient-related classes/ids
-            {'class_pattern': r'ingredient', 'flags': re.IGNORECASE},
-            {'id_pattern': r'ingredient', 'flags': re.IGNORECASE},
-        ]
+        # One document walk finds both headings and ingredient-tagged elements
+        for element in soup.select(_INGREDIENT_SELECTOR):
+            if element.name in _HEADING_TAGS and _INGREDIENTS_HEADING_RE.search(element.get_text()):
+                # Found ingredients heading, look for list after it
+                ingredients = self._extract_list_after_element(element)
+                if ingredients:
+                    return ingredients
+            if _INGREDIENT_RE.search(' '.join(element.get('class', ()))):
+                class_matches.append(element)
+            if _INGREDIENT_RE.search(element.get('id', '')):
+                id_matches.append(element)
         
-        for pattern in ingredient_patterns:
-            if 'tag' in pattern:
-                # Look for ingredient headings
-                headings = soup.find_all(pattern['tag'])
-                for heading in headings:
-                    if re.search(pattern['text_pattern'], heading.get_text(), pattern['flags']):
-                        # Found ingredients heading, look for list after it
-                        ingredients = self._extract_list_after_element(heading)
-                        if ingredients:
-                            return ingredients
-            
-            if 'class_pattern' in pattern:
-                # Look for elements with ingredient classes
-                elements = soup.find_all(class_=re.compile(pattern['class_pattern'], pattern['flags']))
-                for element in elements:
-                    found_ingredients = self._extract_ingredients_from_element(element)
-                    if found_ingredients:
-                        ingredients.extend(found_ingredients)
-            
-            if 'id_pattern' in pattern:
-                # Look for elements with ingredient IDs
-                elements = soup.find_all(id=re.compile(pattern['id_pattern'], pattern['flags']))
-                for element in elements:
-                    found_ingredients = self._extract_ingredients_from_element(element)
-                    if found_ingredients:
-                        ingredients.extend(found_ingredients)
-        
-        # Remove duplicates while preserving order
+        # No usable heading; gather from ingredient classes first, then ids, dropping
+        # duplicates as they are found and stopping at 20 ingredients
         seen = set()
         unique_ingredients = []
-        for ingredient in ingredients:
-            if ingredient.lower() not in seen:
-                seen.add(ingredient.lower())
-                unique_ingredients.append(ingredient)
+        for element in class_matches + id_matches:
+            for ingredient in self._extract_ingredients_from_element(element):
+                key = ingredient.casefold()
+                if key not in seen:
+                    seen.add(key)
+                    unique_ingredients.append(ingredient)
+                    if len(unique_ingredients) == 20:
+                        return unique_ingredients
         
-        return unique_ingredients[:20]  # Limit to 20 ingredients max
+        return unique_ingredients
 
     def _extract_list_after_element(self, element):
         """Extract list items that come after a given element"""
@@ -152,10 +342,11 @@ class MealPrepCalendarGenerator:
         while current and len(ingredients) < 20:
             if hasattr(current, 'name'):
                 if current.name in ['ul', 'ol']:
-                    # Found a list, extract items
+                    # Found a list, extract items; strip=True trims each text node while
+                    # walking and drops whitespace-only ones, so no strip() pass afterwards
                     items = current.find_all('li')
                     for item in items:
-                        text = item.get_text().strip()
+                        text = item.get_text(' ', strip=True)
                         if text and len(text) < 200:  # Reasonable ingredient length
                             ingredients.append(text)
                     break
@@ -165,7 +356,7 @@ class MealPrepCalendarGenerator:
                     for list_elem in lists:
                         items = list_elem.find_all('li')
                         for item in items:
-                            text = item.get_text().strip()
+                            text = item.get_text(' ', strip=True)
                             if text and len(text) < 200:
                                 ingredients.append(text)
                     if ingredients:
@@ -183,7 +374,7 @@ class MealPrepCalendarGenerator:
         for list_elem in lists:
             items = list_elem.find_all('li')
             for item in items:
-                text = item.get_text().strip()
+                text = item.get_text(' ', strip=True)
                 if text and len(text) < 200:  # Reasonable ingredient length
                     ingredients.append(text)
         
@@ -191,9 +382,9 @@ class MealPrepCalendarGenerator:
         if not ingredients:
             # Look for elements that might be individual ingredients
             potential_ingredients = element.find_all(['p', 'div', 'span'], 
-                                                   class_=re.compile(r'ingredient|item', re.IGNORECASE))
+                                                   class_=_INGREDIENT_ITEM_RE)
             for item in potential_ingredients:
-                text = item.get_text().strip()
+                text = item.get_text(' ', strip=True)
                 if text and len(text) < 200 and len(text) > 3:
                     ingredients.append(text)
         
@@ -219,26 +410,36 @@ class MealPrepCalendarGenerator:
         return "Recipe"
 
     def _format_recipe_for_analysis(self, recipe_content):
-        """Format extracted recipe data for AI analysis"""
+        """Format extracted recipe data for AI analysis, capped at the content limit"""
         parts = []
+        length = -1  # joined length so far; the first part has no leading newline
+        
+        # Stop building lines as soon as the limit is reached instead of trimming afterwards
+        for line in self._iter_recipe_lines(recipe_content):
+            parts.append(line)
+            length += len(line) + 1
+            if length >= _RECIPE_CONTENT_LIMIT:
+                break
         
+        return "\n".join(parts)[:_RECIPE_CONTENT_LIMIT]
+
+    def _iter_recipe_lines(self, recipe_content):
+        """Yield the lines of the formatted recipe in order"""
         if recipe_content.get('name'):
-            parts.append(f"Recipe Name: {recipe_content['name']}")
+            yield f"Recipe Name: {recipe_content['name']}"
         
         if recipe_content.get('ingredients'):
-            parts.append("Ingredients:")
+            yield "Ingredients:"
             for ingredient in recipe_content['ingredients']:
-                parts.append(f"- {ingredient}")
+                yield f"- {ingredient}"
         
         if recipe_content.get('instructions'):
-            parts.append("Instructions (first few steps):")
+            yield "Instructions (first few steps):"
             for i, instruction in enumerate(recipe_content['instructions'][:3], 1):
-                parts.append(f"{i}. {instruction}")
-        
-        return "\n".join(parts)
+                yield f"{i}. {instruction}"
 
     def check_allergies_and_get_substitutes(self, recipe_content, recipe_url):
-        """Use Llama3 to check for allergies and suggest substitutes"""
+        """Use the local Llama model to check for allergies and suggest substitutes"""
         if not self.allergies or not recipe_content:
             return [], {}
         
@@ -275,34 +476,125 @@ Be conservative - only flag ingredients that clearly contain the specified aller
 
         try:
             response = ollama.chat(
-                model='llama3',
-                messages=[{'role': 'user', 'content': prompt}]
+                model=_ALLERGY_MODEL,
+                messages=[{'role': 'user', 'content': prompt}],
+                format='json',
+                options={'num_ctx': _ALLERGY_NUM_CTX, 'temperature': 0, 'num_predict': 256},
+                keep_alive=_ALLERGY_KEEP_ALIVE
             )
             
-            # Parse the response
-            response_text = response['message']['content'].strip()
-            
-            # Extract JSON from response
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                result = json.loads(json_match.group())
-                allergens_found = result.get('allergens_found', [])
-                substitutes = result.get('substitutes', {})
-                
-                # Validate the data
-                allergens_found = [a for a in allergens_found if isinstance(a, str)]
-                validated_substitutes = {}
-                for allergen, subs in substitutes.items():
-                    if isinstance(subs, list):
-                        validated_substitutes[allergen] = [s for s in subs if isinstance(s, str)]
-                
-                return allergens_found, validated_substitutes
+            # JSON mode guarantees the reply is a bare JSON document
+            return self._validate_allergy_result(_json_loads(response['message']['content']))
             
         except Exception as e:
-            print(f"Warning: Allergy check failed for {recipe_url}: {e}")
+            log.warning("Warning: Allergy check failed for %s: %s", recipe_url, e)
         
         return [], {}
 
+    def check_allergies_batch(self, recipe_contents):
+        """Check several recipes for allergies with one model request per batch.
+
+        Takes {url: recipe_content} and returns {url: (allergens_found, substitutes)}
+        for each recipe the model answered for.
+        """
+        if not self.allergies:
+            return {}
+        
+        urls = [url for url, content in recipe_contents.items() if content]
+        batches = [urls[start:start + _ALLERGY_BATCH_SIZE]
+                   for start in range(0, len(urls), _ALLERGY_BATCH_SIZE)]
+        if not batches:
+            return {}
+
+        # Each batch is a blocking HTTP call to the Ollama server, so threads overlap them
+        results = {}
+        with ThreadPoolExecutor(max_workers=min(_ALLERGY_WORKERS, len(batches))) as executor:
+            for batch_results in executor.map(
+                    lambda batch: self._check_allergy_batch(batch, recipe_contents), batches):
+                results.update(batch_results)
+        return results
+
+    def _check_allergy_batch(self, urls, recipe_contents):
+        allergies_list = ", ".join(self.allergies)
+        recipes_text = "\n\n".join(f"=== RECIPE {i} ===\n{recipe_contents[url]}"
+                                    for i, url in enumerate(urls, 1))
+        
+        prompt = f"""
+You are an expert nutritionist. For each recipe below, analyze ONLY its ingredients list and identify any ingredients that contain or may contain these allergens: {allergies_list}
+
+{recipes_text}
+
+IMPORTANT: 
+- Analyze each recipe separately, using only the ingredients explicitly listed for it
+- Do not assume or add ingredients that are not listed
+- Focus on the actual ingredient names, not cooking methods or instructions
+- For each allergen found, suggest 2-3 practical substitutes
+
+Please respond with ONLY a JSON object in this exact format, with one entry per recipe:
+{{
+  "results": [
+    {{
+      "recipe_index": 1,
+      "allergens_found": ["allergen1", "allergen2"],
+      "substitutes": {{
+        "allergen1": ["substitute1", "substitute2", "substitute3"],
+        "allergen2": ["substitute1", "substitute2"]
+      }}
+    }}
+  ]
+}}
+
+For a recipe with no allergens, use "allergens_found": [] and "substitutes": {{}}.
+
+Be conservative - only flag ingredients that clearly contain the specified allergens.
+"""
+
+        results = {}
+        try:
+            response = ollama.chat(
+                model=_ALLERGY_MODEL,
+                messages=[{'role': 'user', 'content': prompt}],
+                format='json',
+                options={'num_ctx': _ALLERGY_BATCH_NUM_CTX, 'temperature': 0,
+                         'num_predict': 256 * len(urls)},
+                keep_alive=_ALLERGY_KEEP_ALIVE
+            )
+            
+            for entry in _json_loads(response['message']['content']).get('results', []):
+                if not isinstance(entry, dict):
+                    continue
+                index = entry.get('recipe_index')
+                if isinstance(index, int) and 1 <= index <= len(urls):
+                    results[urls[index - 1]] = self._validate_allergy_result(entry)
+        
+        except Exception as e:
+            log.warning("Warning: Batched allergy check failed for %d recipes: %s", len(urls), e)
+        
+        return results
+
+    def _validate_allergy_result(self, result):
+        """Keep only well-formed allergen names and substitute lists from a model reply"""
+        allergens_found = result.get('allergens_found', [])
+        substitutes = result.get('substitutes', {})
+        
+        allergens_found = [a for a in allergens_found if isinstance(a, str)]
+        validated_substitutes = {}
+        for allergen, subs in substitutes.items():
+            if isinstance(subs, list):
+                validated_substitutes[allergen] = [s for s in subs if isinstance(s, str)]
+        
+        return allergens_found, validated_substitutes
+
+    def _recipe_allergy_info(self, url, title):
+        """Allergy warning text for a recipe, checking it now if the batch missed it"""
+        if not self.allergies:
+            return ""
+        if url not in self._allergy_cache:
+            log.info("Checking allergies and finding substitutes for: %s", title)
+            recipe_content = self.extract_recipe_content(url)
+            self._allergy_cache[url] = self.check_allergies_and_get_substitutes(recipe_content, url)
+        return self.format_allergy_info(*self._allergy_cache[url])
+
     def format_allergy_info(self, allergens_found, substitutes):
         """Format allergy information and substitutes for calendar description"""
         if not allergens_found:
@@ -320,150 +612,176 @@ Be conservative - only flag ingredients that clearly contain the specified aller
         return "".join(info_parts)
 
     def extract_title(self, url):
+        if url in self._title_cache:
+            return self._title_cache[url]
         try:
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
-            title = None
-            og_title = soup.find('meta', property='og:title')
-            if og_title and og_title.get('content'):
-                title = og_title.get('content').strip()
-            if not title:
-                scripts = soup.find_all('script', type='application/ld+json')
-                for script in scripts:
-                    try:
-                        data = json.loads(script.string)
-                        if isinstance(data, list):
-                            for entry in data:
-                                if isinstance(entry, dict) and ('Recipe' in str(entry.get('@type', ''))):
-                                    if 'name' in entry:
-                                        title = entry['name'].strip()
-                                        break
-                        elif isinstance(data, dict) and ('Recipe' in str(data.get('@type', ''))):
-                            if 'name' in data:
-                                title = data['name'].strip()
-                                break
-                    except Exception:
-                        continue
-            if not title:
-                h1 = soup.find('h1')
-                if h1 and h1.get_text():
-                    title = h1.get_text().strip()
-            if not title:
-                title_tag = soup.find('title')
-                if title_tag and title_tag.get_text():
-                    title = title_tag.get_text().strip()
-            if not title:
-                path = urlparse(url).path
-                filename = os.path.basename(path)
-                filename = unquote(filename)
-                filename = re.sub(r'[-_]', ' ', filename)
-                filename = re.sub(r'\.html?$', '', filename, flags=re.IGNORECASE)
-                title = filename.strip() or "Recipe"
-            title = re.sub(r'\s*[-|]\s*(Recipe|Recipes|Cooking|Kitchen|Food).*$', '', title, flags=re.IGNORECASE)
-            title = title.strip()
-            if len(title) > 60:
-                title = title[:57] + "..."
-            return title
+            title = self._parse_title(self._fetch_page(url), url)
         except Exception:
-            path = urlparse(url).path
-            filename = os.path.basename(path)
-            filename = unquote(filename)
-            filename = re.sub(r'[-_]', ' ', filename)
-            filename = re.sub(r'\.html?$', '', filename, flags=re.IGNORECASE)
-            title = filename.strip() or "Recipe"
-            return title
+            title = _title_from_url(url)
+        self._title_cache[url] = title
+        return title
+
+    def _fetch_page(self, url):
+        """Return the HTML body for a URL, using the prefetched copy when there is one"""
+        if url in self._page_cache:
+            return self._page_cache[url]
+        response = self.session.get(url, timeout=10)
+        response.raise_for_status()
+        self._page_cache[url] = response.content
+        return response.content
+
+    async def _fetch_html(self, session, semaphore, url):
+        """Fetch the raw HTML body for a recipe URL"""
+        async with semaphore:
+            async with session.get(url) as response:
+                response.raise_for_status()
+                return await response.read()
+
+    async def _fetch_all(self, urls):
+        """Fetch every URL not already cached concurrently into the page cache"""
+        if aiohttp is None:
+            return
+        pending = [url for url in dict.fromkeys(urls) if url not in self._page_cache]
+        if not pending:
+            return
+
+        semaphore = asyncio.Semaphore(_FETCH_CONCURRENCY)
+        timeout = aiohttp.ClientTimeout(total=10)
+        async with aiohttp.ClientSession(headers=self.headers, timeout=timeout) as session:
+            tasks = [self._fetch_html(session, semaphore, url) for url in pending]
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        # Failures are left out so _fetch_page retries them through the session,
+        # which backs off on rate limits and transient server errors
+        for url, page in zip(pending, results):
+            if isinstance(page, BaseException):
+                log.info("Prefetch failed for %s, will retry: %s", url, page)
+            else:
+                self._page_cache[url] = page
+
+    def _resolve_titles(self, urls):
+        """Map each URL to its title, prefetching pages concurrently when possible"""
+        if aiohttp is not None:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return asyncio.run(self.fetch_all_titles(urls))
+        # No aiohttp, or called from inside a running event loop (async code, Jupyter)
+        # where asyncio.run isn't allowed: fetch through the session one page at a time
+        return {url: self.extract_title(url) for url in urls}
+
+    async def fetch_all_titles(self, urls):
+        """Fetch all unique recipe URLs concurrently and map each URL to its title"""
+        await self._fetch_all(url for url in urls if url not in self._title_cache)
+        return {url: self.extract_title(url) for url in urls}
+
+    def _parse_title(self, html, url):
+        """Extract a clean recipe title from fetched HTML"""
+        soup = BeautifulSoup(html, _HTML_PARSER, parse_only=_TITLE_STRAINER)
+        title = None
+        og_title = soup.find('meta', property='og:title')
+        if og_title and og_title.get('content'):
+            title = og_title.get('content').strip()
+        if not title:
+            # Decoded once per page and shared with recipe content extraction
+            recipe_data = self._recipe_jsonld(url, soup)
+            name = recipe_data.get('name') if recipe_data else None
+            if isinstance(name, str):
+                title = name.strip()
+        if not title:
+            h1 = soup.find('h1')
+            if h1 and h1.get_text():
+                title = h1.get_text().strip()
+        if not title:
+            title_tag = soup.find('title')
+            if title_tag and title_tag.get_text():
+                title = title_tag.get_text().strip()
+        if not title:
+            title = _title_from_url(url)
+        title = _TITLE_TAIL_RE.sub('', title)
+        title = title.strip()
+        if len(title) > 60:
+            title = title[:57] + "..."
+        return title
 
     def read_recipes_from_csv(self, filename):
         """Read recipes from CSV and shuffle them for better randomization"""
-        recipes = []
-        with open(filename, newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                url = row['url'].strip()
-                try:
-                    days = int(row['days'])
-                except:
-                    days = 5
-                recipes.append({'url': url, 'days': days})
+        st = os.stat(filename)
+        recipes = [{'url': url, 'days': days}
+                   for url, days in _parse_recipes_cached(filename, st.st_mtime_ns, st.st_size)]
         
         # Shuffle the recipes list to ensure random starting order
-        random.shuffle(recipes)
+        self._rng.shuffle(recipes)
         return recipes
 
+    def _choose_recipe(self, recipes, excluded_urls):
+        """Randomly pick a recipe whose URL is not excluded, or None if none qualify"""
+        n = len(recipes)
+        # Common case: exclusions are a minority, so a random index hits within ~2 draws.
+        # Small lists are mostly excluded and go straight to the scan below.
+        if len(excluded_urls) * 2 < n:
+            for _ in range(_SAMPLE_ATTEMPTS):
+                recipe = recipes[self._rng.randrange(n)]
+                if recipe['url'] not in excluded_urls:
+                    return recipe
+
+        # Most of the list is excluded; reservoir-sample what's left in one pass
+        # (each allowed recipe ends up chosen with probability 1/count)
+        chosen = None
+        count = 0
+        for recipe in recipes:
+            if recipe['url'] not in excluded_urls:
+                count += 1
+                if self._rng.randrange(count) == 0:
+                    chosen = recipe
+        return chosen
+
     def get_next_recipe(self, recipes, prev_url, used_recent):
         """Get next recipe avoiding previous and recently used recipes"""
         
         # Level 1: Avoid previous and recent URLs
-        level1_options = [recipe for recipe in recipes 
-                         if (recipe['url'] != prev_url and 
-                             recipe['url'] not in used_recent)]
+        recipe = self._choose_recipe(recipes, {prev_url, *used_recent})
         
         # Level 2: Just avoid previous URL
-        level2_options = [recipe for recipe in recipes 
-                         if recipe['url'] != prev_url]
-        
-        # Try each level, randomly selecting from available options
-        if level1_options:
-            return random.choice(level1_options)
-        elif level2_options:
-            return random.choice(level2_options)
-        else:
-            # Last resort: return random recipe
-            return random.choice(recipes)
+        if recipe is None:
+            recipe = self._choose_recipe(recipes, {prev_url})
+        
+        # Last resort: return random recipe
+        if recipe is None:
+            recipe = self._rng.choice(recipes)
+        return recipe
 
     def get_next_recipe_avoiding_conflict(self, recipes, prev_url, used_recent, conflicting_url):
         """Get next recipe while avoiding conflicts with the other meal type"""
         
-        # Create lists of available recipes based on different restriction levels
-        
         # Level 1: Avoid previous, recent, and conflicting URLs
-        level1_options = [recipe for recipe in recipes 
-                         if (recipe['url'] != prev_url and 
-                             recipe['url'] not in used_recent and 
-                             recipe['url'] != conflicting_url)]
+        recipe = self._choose_recipe(recipes, {prev_url, conflicting_url, *used_recent})
         
         # Level 2: Avoid previous and conflicting URLs (ignore recent)
-        level2_options = [recipe for recipe in recipes 
-                         if (recipe['url'] != prev_url and 
-                             recipe['url'] != conflicting_url)]
+        if recipe is None:
+            recipe = self._choose_recipe(recipes, {prev_url, conflicting_url})
         
         # Level 3: Just avoid conflicting URL
-        level3_options = [recipe for recipe in recipes 
-                         if recipe['url'] != conflicting_url]
-        
-        # Try each level in order, randomly selecting from available options
-        if level1_options:
-            return random.choice(level1_options)
-        elif level2_options:
-            return random.choice(level2_options)
-        elif level3_options:
-            return random.choice(level3_options)
-        else:
-            # Last resort: return random recipe (shouldn't happen with 2+ recipes)
-            return random.choice(recipes)
-
-    def create_meal_prep_calendar(self, recipes, output_file="meal_prep_calendar.csv",
-                                 start_date=None, num_weeks=4,
-                                 first_lunch_url=None, first_dinner_url=None):
+        if recipe is None:
+            recipe = self._choose_recipe(recipes, {conflicting_url})
         
-        # Push start date forward by one day by default
-        if start_date is None:
-            start_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
-        else:
-            start_date = start_date + timedelta(days=1)
-        if len(recipes) < 2:
-            print("Error: Need at least 2 recipes")
-            return
+        # Last resort: return random recipe (shouldn't happen with 2+ recipes)
+        if recipe is None:
+            recipe = self._rng.choice(recipes)
+        return recipe
+
+    def _append_meal_event(self, events, date_str, subject, description, location=''):
+        """Append one all-day calendar row (a prep reminder or the meal itself) in _FIELDS order"""
+        events.append((subject, date_str, '', date_str, '', _ALL_DAY, description, location, _PRIVATE))
 
-        all_events = []
+    def _iter_days(self, recipes, recipes_by_url, titles, date_strs, total_days,
+                   first_lunch_url=None, first_dinner_url=None):
+        """Schedule the plan one day at a time, yielding each day's rows in _FIELDS order"""
         prev_lunch_url = None
         prev_dinner_url = None
-        lunch_used_recent = []
-        dinner_used_recent = []
-        
-        # Cache for recipe content, allergies, and substitutes
-        recipe_cache = {}
+        # Only the last two picks per meal matter when choosing the next recipe
+        lunch_used_recent = deque(maxlen=2)
+        dinner_used_recent = deque(maxlen=2)
         
         # Track current active meals to avoid conflicts
         current_lunch_recipe = None
@@ -471,238 +789,225 @@ Be conservative - only flag ingredients that clearly contain the specified aller
         lunch_days_remaining = 0
         dinner_days_remaining = 0
 
-        current_date = start_date
-        total_days = num_weeks * 7
+        # Formatted allergy text per URL, built the first time a recipe is scheduled
+        allergy_infos = {}
+
+        # Bound once; both are called for every meal of every day
+        append_event = self._append_meal_event
+        next_recipe = self.get_next_recipe_avoiding_conflict
 
         # Process day by day to ensure lunch and dinner are never the same
         for day in range(total_days):
-            meal_date = current_date + timedelta(days=day)
-            
+            day_events = []
+            date_str = date_strs[day]
+
             # LUNCH PROCESSING
             if lunch_days_remaining <= 0:
                 # Need a new lunch recipe
                 if day == 0 and first_lunch_url:
-                    recipe = next((r for r in recipes if r['url'] == first_lunch_url), None)
-                    if not recipe:
-                        print(f"Error: --first-lunch-url {first_lunch_url} not found in recipe list.")
-                        sys.exit(1)
+                    # Already checked against recipes_by_url by create_meal_prep_calendar
+                    recipe = recipes_by_url[first_lunch_url]
                 else:
                     # Get next lunch recipe, ensuring it's different from current dinner
-                    recipe = self.get_next_recipe_avoiding_conflict(
-                        recipes, prev_lunch_url, lunch_used_recent[-2:], 
+                    recipe = next_recipe(
+                        recipes, prev_lunch_url, lunch_used_recent, 
                         current_dinner_recipe['url'] if current_dinner_recipe else None
                     )
-                
+
                 current_lunch_recipe = recipe
                 lunch_days_remaining = recipe['days']
                 prev_lunch_url = recipe['url']
                 lunch_used_recent.append(recipe['url'])
-                
-                # Get allergy info for lunch
-                lunch_title = self.extract_title(recipe['url'])
-                allergens_found = []
-                substitutes = {}
-                if self.allergies:
-                    if recipe['url'] not in recipe_cache:
-                        print(f"Checking allergies and finding substitutes for: {lunch_title}")
-                        recipe_content = self.extract_recipe_content(recipe['url'])
-                        allergens_found, substitutes = self.check_allergies_and_get_substitutes(recipe_content, recipe['url'])
-                        recipe_cache[recipe['url']] = (allergens_found, substitutes)
-                    else:
-                        allergens_found, substitutes = recipe_cache[recipe['url']]
-                
-                allergy_info = self.format_allergy_info(allergens_found, substitutes)
-                
+
+                # Get title and allergy info for lunch
+                lunch_title = titles[recipe['url']]
+                if recipe['url'] not in allergy_infos:
+                    allergy_infos[recipe['url']] = self._recipe_allergy_info(recipe['url'], lunch_title)
+                allergy_info = allergy_infos[recipe['url']]
+
+                # Meal rows reuse these strings every day this recipe is active; only the date changes
+                lunch_subject = f"Lunch: {lunch_title}"
+                lunch_description = f"Lunch - {lunch_title}\nRecipe: {recipe['url']}{allergy_info}"
+
                 # Schedule prep event (on previous day if not first day)
-                if day > 0:
-                    prep_date = current_date + timedelta(days=day - 1)
-                else:
-                    prep_date = meal_date
-                    
-                all_events.append({
-                    'Subject': f"Prep: Lunch - {lunch_title}",
-                    'Start Date': prep_date.strftime('%m/%d/%Y'),
-                    'Start Time': '',
-                    'End Date': prep_date.strftime('%m/%d/%Y'),
-                    'End Time': '',
-                    'All Day Event': 'True',
-                    'Description': f"Prep for lunch: {lunch_title}\n{recipe['url']}{allergy_info}",
-                    'Location': 'Kitchen',
-                    'Private': 'False'
-                })
-            
+                prep_date_str = date_strs[day - 1] if day > 0 else date_str
+                append_event(day_events, prep_date_str, f"Prep: Lunch - {lunch_title}",
+                             f"Prep for lunch: {lunch_title}\n{recipe['url']}{allergy_info}",
+                             _PREP_LOCATION)
+
             # Schedule lunch meal event
-            lunch_title = self.extract_title(current_lunch_recipe['url'])
-            allergens_found, substitutes = recipe_cache.get(current_lunch_recipe['url'], ([], {}))
-            allergy_info = self.format_allergy_info(allergens_found, substitutes)
-            
-            all_events.append({
-                'Subject': f"Lunch: {lunch_title}",
-                'Start Date': meal_date.strftime('%m/%d/%Y'),
-                'Start Time': '',
-                'End Date': meal_date.strftime('%m/%d/%Y'),
-                'End Time': '',
-                'All Day Event': 'True',
-                'Description': f"Lunch - {lunch_title}\nRecipe: {current_lunch_recipe['url']}{allergy_info}",
-                'Location': '',
-                'Private': 'False'
-            })
-            
+            append_event(day_events, date_str, lunch_subject, lunch_description)
+
             lunch_days_remaining -= 1
-            
+
             # DINNER PROCESSING
             if dinner_days_remaining <= 0:
                 # Need a new dinner recipe
                 if day == 0 and first_dinner_url:
-                    recipe = next((r for r in recipes if r['url'] == first_dinner_url), None)
-                    if not recipe:
-                        print(f"Error: --first-dinner-url {first_dinner_url} not found in recipe list.")
-                        sys.exit(1)
+                    # Already checked against recipes_by_url by create_meal_prep_calendar
+                    recipe = recipes_by_url[first_dinner_url]
                 else:
                     # Get next dinner recipe, ensuring it's different from current lunch
-                    recipe = self.get_next_recipe_avoiding_conflict(
-                        recipes, prev_dinner_url, dinner_used_recent[-2:], 
+                    recipe = next_recipe(
+                        recipes, prev_dinner_url, dinner_used_recent, 
                         current_lunch_recipe['url'] if current_lunch_recipe else None
                     )
-                
+
                 current_dinner_recipe = recipe
                 dinner_days_remaining = recipe['days']
                 prev_dinner_url = recipe['url']
                 dinner_used_recent.append(recipe['url'])
-                
-                # Get allergy info for dinner
-                dinner_title = self.extract_title(recipe['url'])
-                allergens_found = []
-                substitutes = {}
-                if self.allergies:
-                    if recipe['url'] not in recipe_cache:
-                        print(f"Checking allergies and finding substitutes for: {dinner_title}")
-                        recipe_content = self.extract_recipe_content(recipe['url'])
-                        allergens_found, substitutes = self.check_allergies_and_get_substitutes(recipe_content, recipe['url'])
-                        recipe_cache[recipe['url']] = (allergens_found, substitutes)
-                    else:
-                        allergens_found, substitutes = recipe_cache[recipe['url']]
-                
-                allergy_info = self.format_allergy_info(allergens_found, substitutes)
-                
+
+                # Get title and allergy info for dinner
+                dinner_title = titles[recipe['url']]
+                if recipe['url'] not in allergy_infos:
+                    allergy_infos[recipe['url']] = self._recipe_allergy_info(recipe['url'], dinner_title)
+                allergy_info = allergy_infos[recipe['url']]
+
+                # Meal rows reuse these strings every day this recipe is active; only the date changes
+                dinner_subject = f"Dinner: {dinner_title}"
+                dinner_description = f"Dinner - {dinner_title}\nRecipe: {recipe['url']}{allergy_info}"
+
                 # Schedule prep event (on previous day if not first day)
-                if day > 0:
-                    prep_date = current_date + timedelta(days=day - 1)
-                else:
-                    prep_date = meal_date
-                    
-                all_events.append({
-                    'Subject': f"Prep: Dinner - {dinner_title}",
-                    'Start Date': prep_date.strftime('%m/%d/%Y'),
-                    'Start Time': '',
-                    'End Date': prep_date.strftime('%m/%d/%Y'),
-                    'End Time': '',
-                    'All Day Event': 'True',
-                    'Description': f"Prep for dinner: {dinner_title}\n{recipe['url']}{allergy_info}",
-                    'Location': 'Kitchen',
-                    'Private': 'False'
-                })
-            
+                prep_date_str = date_strs[day - 1] if day > 0 else date_str
+                append_event(day_events, prep_date_str, f"Prep: Dinner - {dinner_title}",
+                             f"Prep for dinner: {dinner_title}\n{recipe['url']}{allergy_info}",
+                             _PREP_LOCATION)
+
             # Schedule dinner meal event
-            dinner_title = self.extract_title(current_dinner_recipe['url'])
-            allergens_found, substitutes = recipe_cache.get(current_dinner_recipe['url'], ([], {}))
-            allergy_info = self.format_allergy_info(allergens_found, substitutes)
-            
-            all_events.append({
-                'Subject': f"Dinner: {dinner_title}",
-                'Start Date': meal_date.strftime('%m/%d/%Y'),
-                'Start Time': '',
-                'End Date': meal_date.strftime('%m/%d/%Y'),
-                'End Time': '',
-                'All Day Event': 'True',
-                'Description': f"Dinner - {dinner_title}\nRecipe: {current_dinner_recipe['url']}{allergy_info}",
-                'Location': '',
-                'Private': 'False'
-            })
-            
+            append_event(day_events, date_str, dinner_subject, dinner_description)
+
             dinner_days_remaining -= 1
 
-        # Handle overflow days (meals that extend beyond the planned period)
-        overflow_days = 0
-        if lunch_days_remaining > 0 or dinner_days_remaining > 0:
-            max_overflow = max(lunch_days_remaining, dinner_days_remaining)
-            for extra_day in range(max_overflow):
-                overflow_date = current_date + timedelta(days=total_days + extra_day)
-                
-                # Add remaining lunch days
-                if lunch_days_remaining > 0:
-                    lunch_title = self.extract_title(current_lunch_recipe['url'])
-                    allergens_found, substitutes = recipe_cache.get(current_lunch_recipe['url'], ([], {}))
-                    allergy_info = self.format_allergy_info(allergens_found, substitutes)
-                    
-                    all_events.append({
-                        'Subject': f"Lunch: {lunch_title}",
-                        'Start Date': overflow_date.strftime('%m/%d/%Y'),
-                        'Start Time': '',
-                        'End Date': overflow_date.strftime('%m/%d/%Y'),
-                        'End Time': '',
-                        'All Day Event': 'True',
-                        'Description': f"Lunch - {lunch_title}\nRecipe: {current_lunch_recipe['url']}{allergy_info}",
-                        'Location': '',
-                        'Private': 'False'
-                    })
-                    lunch_days_remaining -= 1
-                
-                # Add remaining dinner days
-                if dinner_days_remaining > 0:
-                    dinner_title = self.extract_title(current_dinner_recipe['url'])
-                    allergens_found, substitutes = recipe_cache.get(current_dinner_recipe['url'], ([], {}))
-                    allergy_info = self.format_allergy_info(allergens_found, substitutes)
-                    
-                    all_events.append({
-                        'Subject': f"Dinner: {dinner_title}",
-                        'Start Date': overflow_date.strftime('%m/%d/%Y'),
-                        'Start Time': '',
-                        'End Date': overflow_date.strftime('%m/%d/%Y'),
-                        'End Time': '',
-                        'All Day Event': 'True',
-                        'Description': f"Dinner - {dinner_title}\nRecipe: {current_dinner_recipe['url']}{allergy_info}",
-                        'Location': '',
-                        'Private': 'False'
-                    })
-                    dinner_days_remaining -= 1
-                
-                overflow_days += 1
-
-        # Write CSV
-        fieldnames = ['Subject', 'Start Date', 'Start Time', 'End Date', 'End Time',
-                      'All Day Event', 'Description', 'Location', 'Private']
-        with open(output_file, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(all_events)
-
-        end_date = current_date + timedelta(days=total_days + overflow_days - 1)
-        print(f"\nCSV file created: {output_file}")
-        print(f"Created {len(all_events)} calendar events")
-        print(f"Calendar runs from {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}")
+            yield day_events
+
+        # Handle overflow days (meals that extend beyond the planned period); each meal
+        # just runs out its remaining days, so the overflow is the longer of the two
+        for extra_day in range(max(lunch_days_remaining, dinner_days_remaining, 0)):
+            day_events = []
+            overflow_date_str = date_strs[total_days + extra_day]
+
+            # Add remaining lunch days
+            if extra_day < lunch_days_remaining:
+                append_event(day_events, overflow_date_str, lunch_subject, lunch_description)
+
+            # Add remaining dinner days
+            if extra_day < dinner_days_remaining:
+                append_event(day_events, overflow_date_str, dinner_subject, dinner_description)
+
+            yield day_events
+
+    def create_meal_prep_calendar(self, recipes, output_file="meal_prep_calendar.csv",
+                                 start_date=None, num_weeks=4,
+                                 first_lunch_url=None, first_dinner_url=None):
+        
+        # Push start date forward by one day by default
+        if start_date is None:
+            start_date = _add_days(date.today(), 1)
+        else:
+            start_date = _add_days(start_date, 1)
+        if len(recipes) < 2:
+            print("Error: Need at least 2 recipes")
+            return
+
+        current_date = start_date
+        total_days = num_weeks * 7
+
+        # Format every date the plan can touch once: the planned days plus the longest
+        # possible overflow from a recipe that is still running on the last day
+        max_overflow_days = max(0, max(r['days'] for r in recipes))
+        base_ord = current_date.toordinal()
+        date_strs = [date.fromordinal(base_ord + i).strftime('%m/%d/%Y')
+                     for i in range(total_days + max_overflow_days)]
+
+        # Index recipes by URL (first occurrence wins) for O(1) lookups
+        recipes_by_url = {}
+        for r in recipes:
+            recipes_by_url.setdefault(r['url'], r)
+
+        # Reject unknown forced first meals up front, before minutes of page fetches
+        # and allergy checks, and before the output file is touched
+        for flag, url in (('--first-lunch-url', first_lunch_url),
+                          ('--first-dinner-url', first_dinner_url)):
+            if url and url not in recipes_by_url:
+                print(f"Error: {flag} {url} not found in recipe list.")
+                sys.exit(1)
+
+        # Recipes repeat across the plan, so fetch each unique page once up front;
+        # titles and allergy checks both read from the prefetched pages
+        titles = self._resolve_titles(list(recipes_by_url))
+
+        # Check recipes for allergens in batched LLM requests; anything the model
+        # skips is checked on its own when first scheduled
         if self.allergies:
-            print(f"Checked for allergies: {', '.join(self.allergies)}")
-            print("Added substitute suggestions where allergens were found")
-        print("✓ Ensured lunch and dinner are never the same recipe on any day")
+            # Load the allergy model before the checks start; if the server can't load it,
+            # that is reported once here
+            try:
+                ollama.generate(model=_ALLERGY_MODEL, prompt='', keep_alive=_ALLERGY_KEEP_ALIVE)
+            except Exception as e:
+                log.warning("Warning: Could not preload %s: %s", _ALLERGY_MODEL, e)
 
+            pending = [url for url in recipes_by_url if url not in self._allergy_cache]
+            if pending:
+                log.info("Checking allergies and finding substitutes for %d recipes", len(pending))
+                contents = {url: self.extract_recipe_content(url) for url in pending}
+                self._allergy_cache.update(self.check_allergies_batch(contents))
 
-def main():
+        # Stream events to the CSV a chunk of days at a time; rows are tuples in _FIELDS
+        # order, formatted by hand since every field is a plain string
+        event_count = 0
+        day_count = 0
+        days = self._iter_days(recipes, recipes_by_url, titles, date_strs, total_days,
+                               first_lunch_url, first_dinner_url)
+        # Write to a fresh temp file beside the target and swap it in, so a failed run
+        # never leaves a half-written calendar in place of the previous one
+        fd, tmp_file = tempfile.mkstemp(prefix='.meal_prep_', suffix='.csv',
+                                        dir=os.path.dirname(output_file) or '.')
+        try:
+            with os.fdopen(fd, 'w', newline='', encoding='utf-8',
+                           buffering=_WRITE_BUFFER_SIZE) as f:
+                # mkstemp makes the file owner-only; keep the mode of the calendar being
+                # replaced, or use the usual rw-r--r-- for a new one
+                try:
+                    shutil.copymode(output_file, tmp_file)
+                except FileNotFoundError:
+                    os.chmod(tmp_file, 0o644)
+                f.write(_format_rows((_FIELDS,)))
+                while True:
+                    chunk = list(islice(days, _WRITE_CHUNK_DAYS))
+                    if not chunk:
+                        break
+                    rows = list(chain.from_iterable(chunk))
+                    f.write(_format_rows(rows))
+                    day_count += len(chunk)
+                    event_count += len(rows)
+            os.replace(tmp_file, output_file)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_file)
+            raise
+
+        end_date = _add_days(current_date, day_count - 1)
+        # Emit the summary in a single write
+        lines = [
+            f"\nCSV file created: {output_file}",
+            f"Created {event_count} calendar events",
+            f"Calendar runs from {start_date.isoformat()} to {end_date.isoformat()}",
+        ]
+        if self.allergies:
+            lines.append(f"Checked for allergies: {', '.join(self.allergies)}")
+            lines.append("Added substitute suggestions where allergens were found")
+        lines.append(f"{_CHECK} Ensured lunch and dinner are never the same recipe on any day")
+        sys.stdout.write("\n".join(lines) + "\n")
+
+
+@functools.lru_cache(maxsize=1)
+def _get_parser():
+    """Build the command-line parser once and reuse it"""
     parser = argparse.ArgumentParser(
         description="Create rolling meal prep calendar with allergy checking",
         formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog="""
-CSV format (when using --file):
-url,days
-https://example.com/chicken-salad,3
-https://example.com/beef-stew,2
-
-Allergies file format (when using --allergies):
-nuts
-dairy
-gluten
-shellfish
-        """
+        epilog=_EPILOG
     )
     parser.add_argument('urls', nargs='*', help='Recipe URLs (or use --file)')
     parser.add_argument('--file', '-f', help='CSV file with columns: url,days')
@@ -715,13 +1020,26 @@ shellfish
     parser.add_argument('--seed', type=int, help='Random seed for consistent results')
     parser.add_argument('--first-lunch-url', help='Force this URL as the first lunch')
     parser.add_argument('--first-dinner-url', help='Force this URL as the first dinner')
-    args = parser.parse_args()
+    parser.add_argument('--verbose', '-v', action='store_true',
+                       help='Show progress messages while generating')
+    return parser
+
+
+def main():
+    args = _get_parser().parse_args()
+
+    # Messages are printed bare, as the CLI always has; warnings carry their own
+    # "Warning: " prefix. --verbose only raises this module's level, so libraries
+    # such as the ollama client's httpx stay at WARNING.
+    logging.basicConfig(level=logging.WARNING, format='%(message)s')
+    if args.verbose:
+        log.setLevel(logging.INFO)
 
     # Parse start date
     start_date = None
     if args.start_date:
         try:
-            start_date = datetime.strptime(args.start_date, '%Y-%m-%d')
+            start_date = date.fromisoformat(args.start_date)
         except ValueError:
             print("Invalid date format. Use YYYY-MM-DD")
             sys.exit(1)
@@ -744,11 +1062,13 @@ shellfish
         first_dinner_url=args.first_dinner_url
     )
     
-    print(f"\nTo import into Google Calendar:")
-    print("1. Go to Google Calendar")
-    print("2. Click the '+' next to 'Other calendars'")
-    print("3. Select 'Import'")
-    print(f"4. Upload the file: {args.output}")
+    sys.stdout.write(
+        "\nTo import into Google Calendar:\n"
+        "1. Go to Google Calendar\n"
+        "2. Click the '+' next to 'Other calendars'\n"
+        "3. Select 'Import'\n"
+        f"4. Upload the file: {args.output}\n"
+    )
 
 if __name__ == "__main__":
     main()
\ No newline at end of file